@@ -19,25 +19,55 @@ Document AI.
 
 import asyncio
 import json
+import os
 import subprocess
 import sys
-from typing import BinaryIO
+from typing import BinaryIO, Optional
 
 from absl import flags
 from pdf_sprinkles import document_ai_ocr
+from pdf_sprinkles import progress as progress_lib
 from pdf_sprinkles import resources
+from pdf_sprinkles import sidecar as sidecar_lib
 from third_party.hocr_tools import hocr_pdf
 
 
 FLAGS = flags.FLAGS
 flags.DEFINE_string('pdf_info_command', '', 'Command to run pdf_info.')
-flags.DEFINE_integer('pdf_info_timeout', 1, 'Timeout in seconds for pdf_info.')
+flags.DEFINE_float('pdf_info_timeout', 1.0, 'Timeout in seconds for pdf_info.')
+flags.DEFINE_integer('request_timeout', 120,
+                     'Budget in seconds for converting a PDF end-to-end.')
+
+
+def _time_remaining(deadline: float) -> float:
+  """Returns seconds left before deadline, raising if it has passed."""
+  remaining = deadline - asyncio.get_running_loop().time()
+  if remaining <= 0:
+    raise asyncio.TimeoutError('Conversion took too long.')
+  return remaining
 
 
 async def convert(input_file: BinaryIO, input_file_name: str,
-                  output_file: BinaryIO):
-  """Converts an image-only PDF into a PDF with OCR text."""
-  document = await document_ai_ocr.recognize(input_file)
+                  output_file: BinaryIO, timeout: Optional[float] = None,
+                  progress: Optional[progress_lib.Progress] = None,
+                  sidecar: Optional[sidecar_lib.Sidecar] = None):
+  """Converts an image-only PDF into a PDF with OCR text.
+
+  Work stops once `timeout` seconds (default: --request_timeout) have passed,
+  and stops promptly if the calling task is cancelled. If set, `progress` is
+  updated as the conversion moves through its stages, and `sidecar` collects
+  the text layer written to output_file.
+  """
+  if timeout is None:
+    timeout = FLAGS.request_timeout
+  deadline = asyncio.get_running_loop().time() + timeout
+  if progress is None:
+    progress = progress_lib.Progress()
+
+  progress.update('recognizing',
+                  input_bytes=os.fstat(input_file.fileno()).st_size)
+  document = await document_ai_ocr.recognize(
+      input_file, timeout=_time_remaining(deadline))
 
   if FLAGS.pdf_info_command:
     pdf_info_command = [resources.GetResourceFilename(FLAGS.pdf_info_command)]
@@ -45,6 +75,9 @@ async def convert(input_file: BinaryIO, input_file_name: str,
     pdf_info_command = [sys.executable, '-m', 'pdf_sprinkles.pdf_info']
 
   # Read mediaboxes from PDFs in a sandbox, limiting how long we'll let it run.
+  progress.update('reading PDF')
+  time_remaining = _time_remaining(deadline)
+  pdf_info_timeout = min(FLAGS.pdf_info_timeout, time_remaining)
   pdf_info = await asyncio.create_subprocess_exec(
       *pdf_info_command,
       stdin=input_file,
@@ -52,7 +85,7 @@ async def convert(input_file: BinaryIO, input_file_name: str,
       stderr=subprocess.DEVNULL)
   try:
     pdf_info_result = await asyncio.wait_for(
-        pdf_info.communicate(), timeout=FLAGS.pdf_info_timeout)
+        pdf_info.communicate(), timeout=pdf_info_timeout)
 
     # Loading mediaboxes after all coroutines finish ensures we've waited for
     # pdf_info to return. This provides cleaner logs if JSON decode fails.
@@ -62,7 +95,18 @@ async def convert(input_file: BinaryIO, input_file_name: str,
   # more user-friendly (and less hacker-friendly) error message.
   except (subprocess.CalledProcessError, asyncio.exceptions.TimeoutError,
           ValueError) as exc:
+    # Running out of request budget isn't the PDF's fault.
+    if (isinstance(exc, asyncio.exceptions.TimeoutError) and
+        time_remaining < FLAGS.pdf_info_timeout):
+      raise asyncio.TimeoutError('Conversion took too long.') from exc
     raise ValueError("Couldn't read uploaded PDF.") from exc
   # We let gRPC errors reach the user unchanged.
+  finally:
+    # Don't leave pdf_info running after a timeout or a cancellation.
+    if pdf_info.returncode is None:
+      pdf_info.kill()
+      await pdf_info.wait()
 
-  await hocr_pdf.export_pdf(document, mediaboxes, input_file_name, output_file)
+  await hocr_pdf.export_pdf(document, mediaboxes, input_file_name, output_file,
+                            deadline=deadline, progress=progress,
+                            sidecar=sidecar)
@@ -12,14 +12,125 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import asyncio
+import io
+import os
+import stat
+import tempfile
+import time
+from unittest import mock
+
+from absl.testing import absltest
+from absl.testing import flagsaver
+from google.cloud import documentai_v1 as documentai
+from pdf_sprinkles import document_ai_ocr
 import pdf_sprinkles.convert
-import unittest
+from third_party.hocr_tools import hocr_pdf
+
+
+class ConvertTest(absltest.TestCase):
+
+  def setUp(self):
+    super().setUp()
+    # Stands in for pdf_info: a process that never finishes on its own.
+    script = self.create_tempfile('slow_pdf_info', '#!/bin/sh\nexec sleep 60\n')
+    os.chmod(script.full_path, stat.S_IRWXU)
+    self.enter_context(
+        flagsaver.flagsaver(pdf_info_command=script.full_path,
+                            pdf_info_timeout=60))
+    self.enter_context(
+        mock.patch.object(document_ai_ocr, 'recognize',
+                          mock.AsyncMock(return_value=documentai.Document())))
+
+    self.processes = []
+    create_subprocess_exec = asyncio.create_subprocess_exec
+
+    async def record_process(*args, **kwargs):
+      process = await create_subprocess_exec(*args, **kwargs)
+      self.processes.append(process)
+      return process
 
+    self.enter_context(
+        mock.patch.object(asyncio, 'create_subprocess_exec', record_process))
+
+  def convert(self, timeout=None):
+    return pdf_sprinkles.convert.convert(tempfile.TemporaryFile(), 'scan.pdf',
+                                         io.BytesIO(), timeout=timeout)
 
-class ConvertTest(unittest.TestCase):
   def test_imports(self):
     self.assertTrue(pdf_sprinkles.convert.convert)
 
+  def test_time_remaining_raises_after_deadline(self):
+    async def time_remaining_after(seconds):
+      now = asyncio.get_running_loop().time()
+      return pdf_sprinkles.convert._time_remaining(now + seconds)
+
+    self.assertGreater(asyncio.run(time_remaining_after(60)), 0)
+    with self.assertRaises(asyncio.TimeoutError):
+      asyncio.run(time_remaining_after(-1))
+
+  def test_cancel_kills_pdf_info(self):
+    async def cancel_during_pdf_info():
+      task = asyncio.ensure_future(self.convert())
+      while not self.processes:
+        await asyncio.sleep(0.01)
+      task.cancel()
+      with self.assertRaises(asyncio.CancelledError):
+        await task
+
+    asyncio.run(cancel_during_pdf_info())
+    self.assertLen(self.processes, 1)
+    self.assertIsNotNone(self.processes[0].returncode)
+
+  def test_request_budget_is_not_blamed_on_pdf(self):
+    with self.assertRaisesRegex(asyncio.TimeoutError, 'took too long'):
+      asyncio.run(self.convert(timeout=0.2))
+    self.assertIsNotNone(self.processes[0].returncode)
+
+  @flagsaver.as_parsed(pdf_info_timeout='0.2')
+  def test_pdf_info_timeout_is_blamed_on_pdf(self):
+    with self.assertRaisesRegex(ValueError, "Couldn't read"):
+      asyncio.run(self.convert(timeout=60))
+
+
+class ExportDeadlineTest(absltest.TestCase):
+
+  def test_next_page_raises_after_deadline(self):
+    async def next_page_after(seconds):
+      now = asyncio.get_running_loop().time()
+      await hocr_pdf.next_page(now + seconds)
+
+    asyncio.run(next_page_after(60))
+    asyncio.run(hocr_pdf.next_page(None))
+    with self.assertRaisesRegex(asyncio.TimeoutError, 'took too long'):
+      asyncio.run(next_page_after(-1))
+
+  def test_export_stops_between_pages(self):
+    document = documentai.Document(pages=[{}, {}, {}])
+    mediaboxes = [(612.0, 792.0)] * 3
+
+    class SlowPages:
+      """Makes each page take longer than the whole deadline."""
+
+      def __init__(self):
+        self.pages_done = 0
+
+      def update(self, stage, pages_done, pages_total):
+        del stage, pages_total  # Unused.
+        self.pages_done = pages_done
+        time.sleep(0.25)
+
+    progress = SlowPages()
+
+    async def export():
+      deadline = asyncio.get_running_loop().time() + 0.2
+      await hocr_pdf.export_pdf(document, mediaboxes, 'scan.pdf', io.BytesIO(),
+                                deadline=deadline, progress=progress)
+
+    with self.assertRaises(asyncio.TimeoutError):
+      asyncio.run(export())
+    self.assertEqual(progress.pages_done, 1)
+
 
 if __name__ == '__main__':
-  unittest.main()
+  absltest.main()
@@ -16,12 +16,17 @@
 
 """Converts an PDF to a searchable PDF using Google Cloud Document AI."""
 
+import asyncio
 import os
-from typing import BinaryIO
+import time
+from typing import BinaryIO, Optional
 
 from absl import flags
 from absl import logging
+from google.api_core import exceptions
+from google.api_core import gapic_v1
 from google.cloud import documentai_v1 as documentai
+from pdf_sprinkles import resilience
 
 
 FLAGS = flags.FLAGS
@@ -29,55 +34,175 @@ flags.DEFINE_string('project_id', None, 'Google Cloud project ID')
 flags.DEFINE_enum('location', 'us', ['us', 'eu'],
                   'Location of document processor')
 flags.DEFINE_string('processor_id', None, 'ID of document processor')
-
-
-_documentai_client = None
-_max_size = 20 * 1024 * 1024
-
-
-def get_documentai_client():
+flags.DEFINE_float('hedge_percentile', 0,
+                   'If set, sends a second, hedged request when Document AI '
+                   'takes longer than this percentile of recent latencies.')
+flags.DEFINE_integer('hedge_min_samples', 20,
+                     'Latencies to observe before sending hedged requests.')
+flags.DEFINE_string('hedge_processor_id', None,
+                    'ID of document processor for hedged requests. Defaults '
+                    'to --processor_id.')
+flags.DEFINE_enum('hedge_location', None, ['us', 'eu'],
+                  'Location of the document processor for hedged requests. '
+                  'Defaults to --location.')
+flags.DEFINE_integer('documentai_retries', 2,
+                     'Times to retry Document AI after a transient error.',
+                     lower_bound=0)
+flags.DEFINE_float('documentai_backoff', 0.5,
+                   'Base delay in seconds between Document AI retries.')
+flags.DEFINE_float('circuit_breaker_error_rate', 0.5,
+                   'Fraction of failed Document AI calls that opens the '
+                   'circuit breaker.')
+flags.DEFINE_integer('circuit_breaker_min_calls', 10,
+                     'Calls needed in the window before the breaker opens.')
+flags.DEFINE_float('circuit_breaker_window', 60,
+                   'Seconds of Document AI calls the breaker considers.')
+flags.DEFINE_float('circuit_breaker_reset', 30,
+                   'Seconds an open breaker fails fast before probing again.')
+flags.register_validator(
+    'hedge_percentile', lambda p: p == 0 or 0 < p <= 100,
+    message='--hedge_percentile must be in (0, 100], e.g. 95, or 0 to disable.')
+
+
+_documentai_clients = {}
+_circuit_breaker = None
+_latencies = resilience.LatencyTracker()
+MAX_SIZE = 20 * 1024 * 1024
+
+# Failures that leave no trace on the server, so the request can be sent again.
+# They also count against the circuit breaker, along with timeouts.
+_RETRYABLE_ERRORS = (exceptions.ServiceUnavailable, exceptions.Aborted,
+                     exceptions.InternalServerError)
+_SERVER_ERRORS = _RETRYABLE_ERRORS + (exceptions.DeadlineExceeded,)
+
+
+def get_documentai_client(location: Optional[str] = None):
   """Lazily constructs and returns a Cloud Document AI client."""
-  global _documentai_client
-  if not _documentai_client:
+  location = location or FLAGS.location
+  if location not in _documentai_clients:
     # You must set the api_endpoint if you use a location other than 'us', e.g.:
     opts = {}
-    if FLAGS.location == 'eu':
+    if location == 'eu':
       opts = {'api_endpoint': 'eu-documentai.googleapis.com'}
-    _documentai_client = documentai.DocumentProcessorServiceAsyncClient(
-        client_options=opts)
+    _documentai_clients[location] = (
+        documentai.DocumentProcessorServiceAsyncClient(client_options=opts))
 
-  return _documentai_client
+  return _documentai_clients[location]
 
 
-async def recognize_content(image_content: bytes):
-  """Recognize text in image_content using Document AI."""
-  if len(image_content) > _max_size:
-    raise ValueError('PDF too large')
+def get_circuit_breaker():
+  """Lazily constructs and returns the circuit breaker for Document AI."""
+  global _circuit_breaker
+  if not _circuit_breaker:
+    _circuit_breaker = resilience.CircuitBreaker(
+        error_rate=FLAGS.circuit_breaker_error_rate,
+        min_calls=FLAGS.circuit_breaker_min_calls,
+        window=FLAGS.circuit_breaker_window,
+        reset_timeout=FLAGS.circuit_breaker_reset)
+  return _circuit_breaker
+
 
-  client = get_documentai_client()
+def hedge_delay() -> Optional[float]:
+  """Returns how long to wait before hedging, or None to never hedge."""
+  if not FLAGS.hedge_percentile:
+    return None
+  return _latencies.percentile(FLAGS.hedge_percentile,
+                               FLAGS.hedge_min_samples)
+
+
+async def _process_document(image_content: bytes, hedge: int,
+                            deadline: Optional[float]):
+  """Makes one process_document call, recording its latency and outcome."""
+  location = FLAGS.location
+  processor_id = FLAGS.processor_id
+  if hedge:
+    location = FLAGS.hedge_location or location
+    processor_id = FLAGS.hedge_processor_id or processor_id
+    logging.info('Sending hedged request to Document AI.')
+
+  client = get_documentai_client(location)
 
   # The full resource name of the processor, e.g.:
   # projects/project-id/locations/location/processor/processor-id
   # You must create new processors in the Cloud Console first
-  name = f'projects/{FLAGS.project_id}/locations/{FLAGS.location}/processors/{FLAGS.processor_id}'
+  name = f'projects/{FLAGS.project_id}/locations/{location}/processors/{processor_id}'
 
   document = {'content': image_content, 'mime_type': 'application/pdf'}
 
   # Configure the process request
   request = {'name': name, 'raw_document': document}
 
-  logging.info('Recognizing input PDF.')
-  result = await client.process_document(request=request)
-  return result.document
+  timeout = gapic_v1.method.DEFAULT
+  if deadline is not None:
+    timeout = deadline - time.monotonic()
+
+  try:
+    # We retry and hedge ourselves, so turn off the client's own retries.
+    result = await client.process_document(
+        request=request, timeout=timeout, retry=None)
+  except _SERVER_ERRORS:
+    get_circuit_breaker().record(False)
+    raise
+  except exceptions.GoogleAPICallError:
+    # Errors about the request, like a bad PDF, say nothing about the server.
+    get_circuit_breaker().record(True)
+    raise
+
+  get_circuit_breaker().record(True)
+  return result
+
+
+async def recognize_content(image_content: bytes,
+                            timeout: Optional[float] = None):
+  """Recognize text in image_content using Document AI.
+
+  When set, `timeout` is sent to Document AI as the gRPC deadline, so the
+  server stops working on a request that we've stopped waiting for. Retries
+  and hedged requests all share that deadline.
+  """
+  if len(image_content) > MAX_SIZE:
+    raise ValueError('PDF too large')
 
+  deadline = None
+  if timeout is not None:
+    deadline = time.monotonic() + timeout
 
-async def recognize(image: BinaryIO):
+  logging.info('Recognizing input PDF.')
+  for attempt in range(FLAGS.documentai_retries + 1):
+    try:
+      get_circuit_breaker().check()
+    except resilience.CircuitOpenError as exc:
+      raise exceptions.ServiceUnavailable(
+          'Document AI is failing right now. Please try again shortly.'
+      ) from exc
+
+    try:
+      start = time.monotonic()
+      result = await resilience.hedged(
+          lambda hedge: _process_document(image_content, hedge, deadline),
+          hedge_delay())
+      # Time the whole hedged call from the first request. Recording only the
+      # winning request would replace each slow primary with its quick hedge,
+      # dragging the percentile, and with it the hedge delay, down.
+      _latencies.record(time.monotonic() - start)
+      return result.document
+    except _RETRYABLE_ERRORS as exc:
+      delay = resilience.backoff_delay(attempt, FLAGS.documentai_backoff)
+      if (attempt == FLAGS.documentai_retries or
+          (deadline is not None and time.monotonic() + delay >= deadline)):
+        raise
+      logging.warning('Retrying Document AI in %.1fs after error: %s', delay,
+                      exc)
+      await asyncio.sleep(delay)
+
+
+async def recognize(image: BinaryIO, timeout: Optional[float] = None):
   """Recognize text in an image file using Document AI."""
   image.seek(0, os.SEEK_END)
   image_size = image.tell()
   image.seek(0)
 
-  if image_size > _max_size:
+  if image_size > MAX_SIZE:
     raise ValueError('PDF too large.')
 
-  return await recognize_content(image.read())
+  return await recognize_content(image.read(), timeout=timeout)
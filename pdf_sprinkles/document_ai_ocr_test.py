@@ -0,0 +1,168 @@
+# Copyright 2022 Google LLC. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import asyncio
+import random
+from unittest import mock
+
+from absl import flags
+from absl.testing import absltest
+from absl.testing import flagsaver
+from google.api_core import exceptions
+from google.cloud import documentai_v1 as documentai
+from pdf_sprinkles import document_ai_ocr
+from pdf_sprinkles import resilience
+
+FLAGS = flags.FLAGS
+
+
+class StubClient:
+  """Stands in for Document AI, with injected latency and errors.
+
+  Each call pops the next (latency, error) from `behaviors`, and records the
+  processor it was sent to.
+  """
+
+  def __init__(self, behaviors):
+    self.behaviors = list(behaviors)
+    self.calls = []
+    self.cancelled = 0
+
+  async def process_document(self, request, timeout, retry):
+    self.calls.append(request['name'])
+    latency, error = self.behaviors.pop(0)
+    try:
+      await asyncio.sleep(latency)
+    except asyncio.CancelledError:
+      self.cancelled += 1
+      raise
+    if error:
+      raise error
+    return documentai.ProcessResponse(
+        document=documentai.Document(text=request['name']))
+
+
+class RecognizeContentTest(absltest.TestCase):
+
+  def setUp(self):
+    super().setUp()
+    self.enter_context(
+        flagsaver.flagsaver(
+            project_id='project', processor_id='primary',
+            documentai_backoff=0, circuit_breaker_min_calls=4))
+    self.enter_context(
+        mock.patch.object(document_ai_ocr, '_circuit_breaker', None))
+    self.enter_context(
+        mock.patch.object(document_ai_ocr, '_latencies',
+                          resilience.LatencyTracker()))
+
+  def recognize(self, client, timeout=None):
+    with mock.patch.object(document_ai_ocr, 'get_documentai_client',
+                           return_value=client):
+      return asyncio.run(
+          document_ai_ocr.recognize_content(b'%PDF', timeout=timeout))
+
+  @flagsaver.flagsaver(hedge_percentile=50, hedge_min_samples=3,
+                       hedge_processor_id='hedge')
+  def test_hedges_slow_request(self):
+    for _ in range(3):
+      self.recognize(StubClient([(0.01, None)]))
+
+    client = StubClient([(5, None), (0.01, None)])
+    document = self.recognize(client)
+
+    self.assertEndsWith(document.text, '/processors/hedge')
+    self.assertLen(client.calls, 2)
+    self.assertEqual(client.cancelled, 1)
+
+  @flagsaver.flagsaver(hedge_percentile=90, hedge_min_samples=20,
+                       hedge_processor_id='hedge')
+  def test_hedge_rate_stays_near_percentile(self):
+    # Latencies are exponential with a 10ms mean, so the true p90 is 23ms and
+    # about one request in ten should be hedged. If the estimate only saw the
+    # hedges that won, it would drift down and hedge ~16% of requests.
+    rng = random.Random(1234)
+    requests = 400
+    client = StubClient(
+        (rng.expovariate(100), None) for _ in range(2 * requests))
+
+    async def recognize_all():
+      with mock.patch.object(document_ai_ocr, 'get_documentai_client',
+                             return_value=client):
+        for _ in range(requests // 20):
+          await asyncio.gather(*(
+              document_ai_ocr.recognize_content(b'%PDF') for _ in range(20)))
+
+    asyncio.run(recognize_all())
+
+    hedges = sum(1 for name in client.calls if name.endswith('/hedge'))
+    self.assertBetween(hedges / requests, 0.05, 0.13)
+    self.assertBetween(document_ai_ocr.hedge_delay(), 0.015, 0.035)
+
+  @flagsaver.flagsaver
+  def test_validates_flags(self):
+    for value in (-1, 101):
+      with self.assertRaises(flags.IllegalFlagValueError):
+        FLAGS.hedge_percentile = value
+    with self.assertRaises(flags.IllegalFlagValueError):
+      FLAGS.documentai_retries = -1
+
+  @flagsaver.flagsaver(hedge_percentile=50, hedge_min_samples=3)
+  def test_does_not_hedge_without_samples(self):
+    client = StubClient([(0.05, None)])
+    self.recognize(client)
+    self.assertLen(client.calls, 1)
+
+  def test_retries_transient_errors(self):
+    client = StubClient([(0, exceptions.ServiceUnavailable('down')),
+                         (0, exceptions.ServiceUnavailable('down')),
+                         (0, None)])
+    document = self.recognize(client)
+    self.assertEndsWith(document.text, '/processors/primary')
+    self.assertLen(client.calls, 3)
+
+  def test_gives_up_after_retries(self):
+    client = StubClient([(0, exceptions.ServiceUnavailable('down'))] * 3)
+    with self.assertRaises(exceptions.ServiceUnavailable):
+      self.recognize(client)
+    self.assertLen(client.calls, 3)
+
+  def test_does_not_retry_bad_requests(self):
+    client = StubClient([(0, exceptions.InvalidArgument('bad PDF'))])
+    with self.assertRaises(exceptions.InvalidArgument):
+      self.recognize(client)
+    self.assertLen(client.calls, 1)
+
+  @flagsaver.flagsaver(documentai_backoff=10)
+  def test_does_not_retry_past_deadline(self):
+    client = StubClient([(0, exceptions.ServiceUnavailable('down'))] * 3)
+    with mock.patch.object(resilience, 'backoff_delay', return_value=10):
+      with self.assertRaises(exceptions.ServiceUnavailable):
+        self.recognize(client, timeout=1)
+    self.assertLen(client.calls, 1)
+
+  @flagsaver.flagsaver(documentai_retries=0)
+  def test_circuit_breaker_fails_fast(self):
+    client = StubClient([(0, exceptions.ServiceUnavailable('down'))] * 4)
+    for _ in range(4):
+      with self.assertRaises(exceptions.ServiceUnavailable):
+        self.recognize(client)
+
+    with self.assertRaisesRegex(exceptions.ServiceUnavailable, 'try again'):
+      self.recognize(client)
+    self.assertLen(client.calls, 4)
+
+
+if __name__ == '__main__':
+  absltest.main()
@@ -0,0 +1,80 @@
+# Copyright 2022 Google LLC. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""progress: coalesced progress reports for long conversions."""
+
+import time
+from typing import Callable, Optional
+
+from absl import flags
+
+FLAGS = flags.FLAGS
+flags.DEFINE_float('progress_interval', 0.5,
+                   'Minimum seconds between published progress reports.')
+
+
+class Progress:
+  """Tracks the progress of a conversion.
+
+  Updates are cheap and may be made as often as once per page: they only
+  record the latest state. It's published to `publish` at most once per
+  `--progress_interval` seconds, and whenever the stage changes.
+  """
+
+  def __init__(self, publish: Optional[Callable[[dict], None]] = None):
+    self._publish = publish
+    self._last_published = 0.0
+    self.stage = None
+    self.pages_done = 0
+    self.pages_total = 0
+    self.input_bytes = 0
+    self.bytes_sent = 0
+
+  def update(self,
+             stage: Optional[str] = None,
+             *,
+             pages_done: Optional[int] = None,
+             pages_total: Optional[int] = None,
+             input_bytes: Optional[int] = None,
+             bytes_sent: Optional[int] = None):
+    """Records progress, publishing it if enough time has passed.
+
+    Fields left as None keep their last value.
+    """
+    stage_changed = stage is not None and stage != self.stage
+    if stage_changed:
+      self.stage = stage
+    if pages_done is not None:
+      self.pages_done = pages_done
+    if pages_total is not None:
+      self.pages_total = pages_total
+    if input_bytes is not None:
+      self.input_bytes = input_bytes
+    if bytes_sent is not None:
+      self.bytes_sent = bytes_sent
+
+    if not self._publish:
+      return
+    now = time.monotonic()
+    if stage_changed or now - self._last_published >= FLAGS.progress_interval:
+      self._last_published = now
+      self._publish(self.report())
+
+  def report(self):
+    return {
+        'stage': self.stage,
+        'pages_done': self.pages_done,
+        'pages_total': self.pages_total,
+        'input_bytes': self.input_bytes,
+        'bytes_sent': self.bytes_sent,
+    }
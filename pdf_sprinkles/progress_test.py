@@ -0,0 +1,55 @@
+# Copyright 2022 Google LLC. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from absl.testing import absltest
+from absl.testing import flagsaver
+from pdf_sprinkles import progress
+
+
+class ProgressTest(absltest.TestCase):
+
+  @flagsaver.flagsaver(progress_interval=3600)
+  def test_coalesces_updates_within_a_stage(self):
+    reports = []
+    p = progress.Progress(reports.append)
+    for pages_done in range(1, 101):
+      p.update('adding text', pages_done=pages_done, pages_total=100)
+    p.update('adding images', pages_done=1)
+
+    self.assertEqual([r['stage'] for r in reports],
+                     ['adding text', 'adding images'])
+    self.assertEqual(reports[0]['pages_done'], 1)
+    self.assertEqual(p.report()['pages_done'], 1)
+    self.assertEqual(p.report()['pages_total'], 100)
+
+  @flagsaver.flagsaver(progress_interval=0)
+  def test_publishes_every_update_without_interval(self):
+    reports = []
+    p = progress.Progress(reports.append)
+    p.update('sending')
+    p.update(bytes_sent=10)
+    p.update(bytes_sent=20)
+    self.assertEqual([r['bytes_sent'] for r in reports], [0, 10, 20])
+
+  def test_rejects_unknown_fields(self):
+    p = progress.Progress()
+    with self.assertRaises(TypeError):
+      p.update('adding text', page_done=1)
+    with self.assertRaises(TypeError):
+      p.update(_publish=None)
+    self.assertEqual(p.report()['pages_done'], 0)
+
+
+if __name__ == '__main__':
+  absltest.main()
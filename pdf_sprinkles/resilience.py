@@ -0,0 +1,147 @@
+# Copyright 2022 Google LLC. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""resilience: hedging, backoff and circuit breaking for remote calls."""
+
+import asyncio
+import collections
+import math
+import random
+import time
+from typing import Awaitable, Callable, Optional, TypeVar
+
+from absl import logging
+
+T = TypeVar('T')
+
+
+class CircuitOpenError(Exception):
+  """A call was refused because its circuit breaker is open."""
+
+
+class LatencyTracker:
+  """Estimates latency percentiles from the most recent calls."""
+
+  def __init__(self, size: int = 100):
+    self._samples = collections.deque(maxlen=size)
+
+  def record(self, seconds: float):
+    self._samples.append(seconds)
+
+  def percentile(self, p: float, min_samples: int = 1) -> Optional[float]:
+    """Returns the p-th percentile, or None without `min_samples` samples."""
+    if len(self._samples) < max(1, min_samples):
+      return None
+    samples = sorted(self._samples)
+    return samples[max(0, math.ceil(p / 100 * len(samples)) - 1)]
+
+
+def backoff_delay(attempt: int, base: float) -> float:
+  """Returns a delay before retry `attempt`, with exponential full jitter."""
+  return random.uniform(0, base * 2**attempt)
+
+
+async def hedged(call: Callable[[int], Awaitable[T]],
+                 hedge_delay: Optional[float]) -> T:
+  """Runs call(0), and call(1) too if call(0) takes over `hedge_delay`.
+
+  Returns the first successful result and cancels the other call. If both
+  calls fail, raises the first call's exception.
+  """
+  primary = asyncio.ensure_future(call(0))
+  if hedge_delay is None:
+    return await primary
+
+  calls = [primary]
+  try:
+    done, _ = await asyncio.wait(calls, timeout=hedge_delay)
+    if not done:
+      calls.append(asyncio.ensure_future(call(1)))
+
+    pending = set(calls)
+    while pending:
+      done, pending = await asyncio.wait(
+          pending, return_when=asyncio.FIRST_COMPLETED)
+      for task in done:
+        if not task.exception():
+          return task.result()
+
+    raise primary.exception()
+  finally:
+    for task in calls:
+      task.cancel()
+
+
+class CircuitBreaker:
+  """Fails fast while the recent error rate is too high.
+
+  Outcomes of the last `window` seconds are kept. Once at least `min_calls`
+  are recorded and `error_rate` of them failed, the breaker opens and refuses
+  calls for `reset_timeout` seconds. Then it lets one probe call through: it
+  closes if the probe succeeds, and opens again if it fails. A probe that never
+  reports back, say because it was cancelled, is replaced after another
+  `reset_timeout` seconds.
+  """
+
+  def __init__(self,
+               error_rate: float,
+               min_calls: int,
+               window: float,
+               reset_timeout: float,
+               clock: Callable[[], float] = time.monotonic):
+    self._error_rate = error_rate
+    self._min_calls = min_calls
+    self._window = window
+    self._reset_timeout = reset_timeout
+    self._clock = clock
+    self._outcomes = collections.deque()
+    self._opened_at = None
+    self._probe_started_at = None
+
+  @property
+  def is_open(self) -> bool:
+    return self._opened_at is not None
+
+  def check(self):
+    """Raises CircuitOpenError unless a call may go ahead now."""
+    if self._opened_at is None:
+      return
+    now = self._clock()
+    last_attempt = max(self._opened_at, self._probe_started_at or 0)
+    if now - last_attempt < self._reset_timeout:
+      raise CircuitOpenError('Too many recent errors; failing fast.')
+    self._probe_started_at = now
+
+  def record(self, success: bool):
+    """Records the outcome of a call allowed by check()."""
+    now = self._clock()
+    if self._opened_at is not None:
+      if self._probe_started_at is not None:
+        self._probe_started_at = None
+        if success:
+          self._opened_at = None
+          self._outcomes.clear()
+        else:
+          self._opened_at = now
+      return
+
+    self._outcomes.append((now, success))
+    while self._outcomes and self._outcomes[0][0] < now - self._window:
+      self._outcomes.popleft()
+
+    failures = sum(1 for _, ok in self._outcomes if not ok)
+    if (len(self._outcomes) >= self._min_calls and
+        failures >= self._error_rate * len(self._outcomes)):
+      logging.warning('Opening circuit breaker: %d of %d recent calls failed.',
+                      failures, len(self._outcomes))
+      self._opened_at = now
@@ -0,0 +1,163 @@
+# Copyright 2022 Google LLC. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import asyncio
+import unittest
+
+from pdf_sprinkles import resilience
+
+
+class FakeClock:
+
+  def __init__(self):
+    self.now = 0.0
+
+  def __call__(self):
+    return self.now
+
+
+def stub_call(latencies, errors=None, started=None):
+  """Returns a hedgeable call that sleeps for latencies[n] seconds."""
+  errors = errors or {}
+
+  async def call(n):
+    if started is not None:
+      started.append(n)
+    await asyncio.sleep(latencies[n])
+    if n in errors:
+      raise errors[n]
+    return n
+
+  return call
+
+
+class HedgedTest(unittest.TestCase):
+
+  def test_fast_primary_is_not_hedged(self):
+    started = []
+    result = asyncio.run(
+        resilience.hedged(stub_call([0, 0], started=started), 0.05))
+    self.assertEqual(result, 0)
+    self.assertEqual(started, [0])
+
+  def test_slow_primary_loses_to_hedge(self):
+    started = []
+    result = asyncio.run(
+        resilience.hedged(stub_call([5, 0], started=started), 0.01))
+    self.assertEqual(result, 1)
+    self.assertEqual(started, [0, 1])
+
+  def test_failed_hedge_waits_for_primary(self):
+    result = asyncio.run(
+        resilience.hedged(
+            stub_call([0.05, 0], errors={1: RuntimeError('hedge')}), 0.01))
+    self.assertEqual(result, 0)
+
+  def test_raises_primary_error_when_both_fail(self):
+    call = stub_call([0.05, 0],
+                     errors={0: KeyError('primary'), 1: RuntimeError('hedge')})
+    with self.assertRaises(KeyError):
+      asyncio.run(resilience.hedged(call, 0.01))
+
+  def test_without_hedge_delay(self):
+    started = []
+    result = asyncio.run(
+        resilience.hedged(stub_call([0.02, 0], started=started), None))
+    self.assertEqual(result, 0)
+    self.assertEqual(started, [0])
+
+
+class LatencyTrackerTest(unittest.TestCase):
+
+  def test_percentile(self):
+    tracker = resilience.LatencyTracker()
+    self.assertIsNone(tracker.percentile(95))
+    for seconds in range(1, 101):
+      tracker.record(seconds)
+    self.assertEqual(tracker.percentile(95), 95)
+    self.assertEqual(tracker.percentile(100), 100)
+    self.assertIsNone(tracker.percentile(95, min_samples=101))
+
+  def test_keeps_recent_samples(self):
+    tracker = resilience.LatencyTracker(size=2)
+    for seconds in (100, 1, 2):
+      tracker.record(seconds)
+    self.assertEqual(tracker.percentile(100), 2)
+
+
+class BackoffTest(unittest.TestCase):
+
+  def test_backoff_grows_with_jitter(self):
+    delays = [resilience.backoff_delay(3, 0.5) for _ in range(100)]
+    self.assertTrue(all(0 <= d <= 4 for d in delays))
+    self.assertGreater(len(set(delays)), 1)
+
+
+class CircuitBreakerTest(unittest.TestCase):
+
+  def setUp(self):
+    self.clock = FakeClock()
+    self.breaker = resilience.CircuitBreaker(
+        error_rate=0.5, min_calls=4, window=60, reset_timeout=30,
+        clock=self.clock)
+
+  def fail(self, n):
+    for _ in range(n):
+      self.breaker.check()
+      self.breaker.record(False)
+
+  def test_opens_at_error_rate(self):
+    self.breaker.record(True)
+    self.breaker.record(True)
+    self.fail(1)
+    self.assertFalse(self.breaker.is_open)
+    self.fail(1)
+    self.assertTrue(self.breaker.is_open)
+    with self.assertRaises(resilience.CircuitOpenError):
+      self.breaker.check()
+
+  def test_forgets_old_outcomes(self):
+    self.fail(3)
+    self.clock.now = 61
+    self.breaker.record(True)
+    self.assertFalse(self.breaker.is_open)
+
+  def test_probe_closes_or_reopens(self):
+    self.fail(4)
+    self.clock.now = 30
+    self.breaker.check()
+    with self.assertRaises(resilience.CircuitOpenError):
+      self.breaker.check()  # Only one probe at a time.
+    self.breaker.record(False)
+    self.assertTrue(self.breaker.is_open)
+
+    self.clock.now = 45
+    with self.assertRaises(resilience.CircuitOpenError):
+      self.breaker.check()
+    self.clock.now = 60
+    self.breaker.check()
+    self.breaker.record(True)
+    self.assertFalse(self.breaker.is_open)
+    self.breaker.check()
+
+  def test_replaces_lost_probe(self):
+    self.fail(4)
+    self.clock.now = 30
+    self.breaker.check()
+    self.clock.now = 60
+    self.breaker.check()
+
+
+if __name__ == '__main__':
+  unittest.main()
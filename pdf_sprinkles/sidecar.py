@@ -0,0 +1,178 @@
+# Copyright 2022 Google LLC. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""sidecar: machine-readable copies of a searchable PDF's text layer.
+
+`hocr_pdf.export_pdf` fills a `Sidecar` with the lines and words it draws, so
+indexers can read text, boxes and confidences without parsing the PDF.
+
+Boxes are `[left, bottom, right, top]` in PDF units (1/72 inch) with the
+origin at the bottom left of the page, as in the PDF itself. hOCR and ALTO
+measure from the top left, so their writers flip the vertical axis.
+"""
+
+import json
+from typing import BinaryIO, Sequence
+import xml.etree.ElementTree as ET
+
+_ALTO_NS = 'http://www.loc.gov/standards/alto/ns-v4#'
+
+# ALTO has no unit for PDF points; 1/1200 inch is the nearest exact one.
+_INCH1200_PER_POINT = 1200 / 72
+
+
+class Sidecar:
+  """Collects the text layer of a PDF as it is drawn."""
+
+  def __init__(self):
+    self.pages = []
+
+  def add_page(self, width: float, height: float):
+    self.pages.append({'width': width, 'height': height, 'lines': []})
+
+  def add_line(self, bbox: Sequence[float], confidence: float):
+    self.pages[-1]['lines'].append({
+        'bbox': _round(bbox),
+        'confidence': round(confidence, 3),
+        'words': []
+    })
+
+  def add_word(self, text: str, bbox: Sequence[float], confidence: float):
+    self.pages[-1]['lines'][-1]['words'].append({
+        'text': text,
+        'bbox': _round(bbox),
+        'confidence': round(confidence, 3)
+    })
+
+
+def _round(bbox):
+  return [round(v, 2) for v in bbox]
+
+
+def write_json(sidecar: Sidecar, output_file: BinaryIO):
+  """Writes compact JSON: {"pages": [{"width", "height", "lines": [...]}]}."""
+  output_file.write(
+      json.dumps({
+          'pages': sidecar.pages
+      }, ensure_ascii=False, separators=(',', ':')).encode('utf-8'))
+
+
+def _top_left_bbox(bbox, page_height):
+  left, bottom, right, top = bbox
+  return [left, page_height - top, right, page_height - bottom]
+
+
+def write_hocr(sidecar: Sidecar, output_file: BinaryIO):
+  """Writes hOCR, with one ocr_page per page and boxes in PDF units."""
+  html = ET.Element('html', xmlns='http://www.w3.org/1999/xhtml')
+  head = ET.SubElement(html, 'head')
+  ET.SubElement(head, 'title').text = 'pdf_sprinkles'
+  ET.SubElement(head, 'meta', {
+      'http-equiv': 'Content-Type',
+      'content': 'text/html; charset=utf-8'
+  })
+  ET.SubElement(head, 'meta', name='ocr-system', content='pdf_sprinkles')
+  ET.SubElement(
+      head, 'meta', name='ocr-capabilities',
+      content='ocr_page ocr_line ocrx_word')
+  body = ET.SubElement(html, 'body')
+
+  def title(bbox, height, **props):
+    coords = ' '.join(str(round(v)) for v in _top_left_bbox(bbox, height))
+    return '; '.join([f'bbox {coords}'] +
+                     [f'{key} {value}' for key, value in props.items()])
+
+  for page_num, page in enumerate(sidecar.pages):
+    height = page['height']
+    page_el = ET.SubElement(
+        body, 'div', {
+            'class': 'ocr_page',
+            'id': f'page_{page_num + 1}',
+            'title': title([0, 0, page['width'], height], height,
+                           ppageno=page_num)
+        })
+    for line_num, line in enumerate(page['lines']):
+      line_el = ET.SubElement(
+          page_el, 'span', {
+              'class': 'ocr_line',
+              'id': f'line_{page_num + 1}_{line_num + 1}',
+              'title': title(line['bbox'], height)
+          })
+      for word_num, word in enumerate(line['words']):
+        word_el = ET.SubElement(
+            line_el, 'span', {
+                'class': 'ocrx_word',
+                'id': f'word_{page_num + 1}_{line_num + 1}_{word_num + 1}',
+                'title': title(word['bbox'], height,
+                               x_wconf=round(100 * word['confidence']))
+            })
+        word_el.text = word['text']
+        word_el.tail = ' '
+
+  output_file.write(b'<!DOCTYPE html>\n')
+  ET.ElementTree(html).write(output_file, encoding='utf-8',
+                             xml_declaration=False, method='xml',
+                             short_empty_elements=False)
+
+
+def write_alto(sidecar: Sidecar, output_file: BinaryIO):
+  """Writes ALTO v4, measured in 1/1200 inch, with a text block per page."""
+  ET.register_namespace('', _ALTO_NS)
+
+  def el(parent, tag, **attrs):
+    return ET.SubElement(parent, f'{{{_ALTO_NS}}}{tag}', attrs)
+
+  def position(bbox, height):
+    left, top, right, bottom = (
+        v * _INCH1200_PER_POINT for v in _top_left_bbox(bbox, height))
+    return {
+        'HPOS': str(round(left)),
+        'VPOS': str(round(top)),
+        'WIDTH': str(round(right - left)),
+        'HEIGHT': str(round(bottom - top)),
+    }
+
+  alto = ET.Element(f'{{{_ALTO_NS}}}alto')
+  description = el(alto, 'Description')
+  el(description, 'MeasurementUnit').text = 'inch1200'
+  layout = el(alto, 'Layout')
+
+  for page_num, page in enumerate(sidecar.pages):
+    height = page['height']
+    page_box = position([0, 0, page['width'], height], height)
+    page_el = el(
+        layout, 'Page', ID=f'page_{page_num + 1}',
+        PHYSICAL_IMG_NR=str(page_num + 1), WIDTH=page_box['WIDTH'],
+        HEIGHT=page_box['HEIGHT'])
+    print_space = el(page_el, 'PrintSpace', **page_box)
+    block = el(print_space, 'TextBlock', ID=f'block_{page_num + 1}',
+               **page_box)
+    for line_num, line in enumerate(page['lines']):
+      line_el = el(block, 'TextLine', ID=f'line_{page_num + 1}_{line_num + 1}',
+                   **position(line['bbox'], height))
+      for word_num, word in enumerate(line['words']):
+        if word_num:
+          el(line_el, 'SP')
+        el(line_el, 'String', CONTENT=word['text'],
+           WC=f"{word['confidence']:.3f}", **position(word['bbox'], height))
+
+  ET.ElementTree(alto).write(output_file, encoding='utf-8',
+                             xml_declaration=True)
+
+
+# Sidecar formats, by name: (file extension, writer).
+FORMATS = {
+    'hocr': ('.hocr', write_hocr),
+    'alto': ('.alto.xml', write_alto),
+    'json': ('.json', write_json),
+}
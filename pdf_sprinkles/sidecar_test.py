@@ -0,0 +1,149 @@
+# Copyright 2022 Google LLC. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import asyncio
+import io
+import json
+import unittest
+import xml.etree.ElementTree as ET
+
+from google.cloud import documentai_v1 as documentai
+from PIL import Image
+from pdf_sprinkles import sidecar as sidecar_lib
+from third_party.hocr_tools import hocr_pdf
+
+_ALTO = '{http://www.loc.gov/standards/alto/ns-v4#}'
+_XHTML = '{http://www.w3.org/1999/xhtml}'
+
+
+def make_sidecar():
+  sidecar = sidecar_lib.Sidecar()
+  sidecar.add_page(612, 792)
+  sidecar.add_line([72, 700, 216, 712], 0.98)
+  sidecar.add_word('Hello', [72, 700, 120, 712], 0.991)
+  sidecar.add_word('wörld', [126, 700, 216, 712], 0.9549)
+  return sidecar
+
+
+def write(write_sidecar, sidecar):
+  output = io.BytesIO()
+  write_sidecar(sidecar, output)
+  return output.getvalue()
+
+
+class SidecarTest(unittest.TestCase):
+
+  def test_json(self):
+    data = json.loads(write(sidecar_lib.write_json, make_sidecar()))
+    line = data['pages'][0]['lines'][0]
+    self.assertEqual(data['pages'][0]['width'], 612)
+    self.assertEqual([w['text'] for w in line['words']], ['Hello', 'wörld'])
+    self.assertEqual(line['words'][1]['bbox'], [126, 700, 216, 712])
+    self.assertEqual(line['words'][1]['confidence'], 0.955)
+
+  def test_hocr_measures_from_top_left(self):
+    html = ET.fromstring(
+        write(sidecar_lib.write_hocr, make_sidecar()).split(b'\n', 1)[1])
+    words = [
+        el for el in html.iter(f'{_XHTML}span')
+        if el.get('class') == 'ocrx_word'
+    ]
+    self.assertEqual(words[0].text, 'Hello')
+    self.assertEqual(words[0].get('title'), 'bbox 72 80 120 92; x_wconf 99')
+
+  def test_alto_measures_in_inch1200(self):
+    alto = ET.fromstring(write(sidecar_lib.write_alto, make_sidecar()))
+    self.assertEqual(alto.find(f'.//{_ALTO}MeasurementUnit').text, 'inch1200')
+    page = alto.find(f'.//{_ALTO}Page')
+    self.assertEqual(page.get('WIDTH'), '10200')
+    strings = alto.findall(f'.//{_ALTO}String')
+    self.assertEqual([s.get('CONTENT') for s in strings], ['Hello', 'wörld'])
+    self.assertEqual(
+        [strings[0].get(k) for k in ('HPOS', 'VPOS', 'WIDTH', 'HEIGHT')],
+        ['1200', '1333', '800', '200'])
+    self.assertEqual(len(alto.findall(f'.//{_ALTO}SP')), 1)
+
+
+def layout(start, end, left, top, right, bottom, confidence):
+  """Returns a Document AI line or token, with a box from the top left."""
+  vertices = [(left, top), (right, top), (right, bottom), (left, bottom)]
+  return {
+      'layout': {
+          'text_anchor': {
+              'text_segments': [{'start_index': start, 'end_index': end}]
+          },
+          'bounding_poly': {
+              'normalized_vertices': [{'x': x, 'y': y} for x, y in vertices]
+          },
+          'confidence': confidence,
+      }
+  }
+
+
+def make_document():
+  image = io.BytesIO()
+  Image.new('L', (85, 110), 255).save(image, 'PNG')
+  return documentai.Document(
+      text='Hello world\nfaint\n',
+      pages=[{
+          'image': {
+              'content': image.getvalue(),
+              'mime_type': 'image/png'
+          },
+          'lines': [
+              layout(0, 12, 0.1, 0.1, 0.5, 0.15, 0.98),
+              layout(12, 18, 0.1, 0.2, 0.3, 0.25, 0.5),
+          ],
+          'tokens': [
+              layout(0, 6, 0.1, 0.1, 0.25, 0.15, 0.99),
+              layout(6, 12, 0.3, 0.1, 0.5, 0.15, 0.95),
+              layout(12, 18, 0.1, 0.2, 0.3, 0.25, 0.5),
+          ],
+      }])
+
+
+class ExportSidecarTest(unittest.TestCase):
+
+  def test_export_fills_sidecar(self):
+    sidecar = sidecar_lib.Sidecar()
+    output = io.BytesIO()
+    asyncio.run(
+        hocr_pdf.export_pdf(make_document(), [(612.0, 792.0)], 'scan.pdf',
+                            output, sidecar=sidecar))
+
+    self.assertTrue(output.getvalue().startswith(b'%PDF'))
+    self.assertEqual(len(sidecar.pages), 1)
+    page = sidecar.pages[0]
+    self.assertEqual((page['width'], page['height']), (612.0, 792.0))
+    # The second line is below --min_confidence, so it's left out.
+    self.assertEqual(len(page['lines']), 1)
+    line = page['lines'][0]
+    self.assertEqual(line['bbox'], [61.2, 673.2, 306.0, 712.8])
+    self.assertEqual(line['confidence'], 0.98)
+    self.assertEqual(line['words'], [
+        {
+            'text': 'Hello',
+            'bbox': [61.2, 673.2, 153.0, 712.8],
+            'confidence': 0.99
+        },
+        {
+            'text': 'world',
+            'bbox': [183.6, 673.2, 306.0, 712.8],
+            'confidence': 0.95
+        },
+    ])
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,242 @@
+# Copyright 2022 Google LLC. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""uploads: resumable, chunked uploads spooled to local disk.
+
+Each upload lives in its own directory under `--upload_spool_dir`:
+
+* `upload.json` records the file name, size, chunk size and owner.
+* `spool.pdf` is preallocated to the full size; chunks are written into it at
+  their own offsets, so they may arrive in any order and be sent again safely.
+* `chunks/<index>` marks each chunk that arrived with a matching checksum.
+* `progress.json` holds the latest progress report once conversion starts.
+
+All state is on disk, so workers sharing a spool directory share uploads.
+Uploads that see no activity for `--upload_expiry` seconds are removed.
+"""
+
+import hashlib
+import json
+import os
+import re
+import secrets
+import shutil
+import tempfile
+import time
+from typing import BinaryIO, List, Optional
+
+from absl import flags
+from absl import logging
+from pdf_sprinkles import document_ai_ocr
+
+FLAGS = flags.FLAGS
+flags.DEFINE_string('upload_spool_dir', '',
+                    'Directory for spooling resumable uploads. Defaults to a '
+                    'directory under the system temporary directory.')
+flags.DEFINE_integer('upload_chunk_size', 1024 * 1024,
+                     'Size in bytes of resumable upload chunks.')
+flags.DEFINE_integer('upload_expiry', 3600,
+                     'Seconds after its last chunk that an unfinished upload '
+                     'is removed.')
+
+_UPLOAD_ID_RE = re.compile(r'^[\w-]{16,64}$')
+
+
+class UploadError(ValueError):
+  """An upload request was malformed or doesn't match the upload's state."""
+
+
+class UnknownUploadError(UploadError):
+  """No such upload exists for this user; it may have expired."""
+
+
+class ChecksumError(UploadError):
+  """A chunk didn't match its checksum, so it should be sent again."""
+
+
+def spool_dir() -> str:
+  if FLAGS.upload_spool_dir:
+    return FLAGS.upload_spool_dir
+  return os.path.join(tempfile.gettempdir(), 'pdf_sprinkles_uploads')
+
+
+def _upload_dir(upload_id: str) -> str:
+  if not _UPLOAD_ID_RE.match(upload_id):
+    raise UnknownUploadError('Unknown upload.')
+  return os.path.join(spool_dir(), upload_id)
+
+
+class Upload:
+  """A resumable upload, as recorded in its spool directory."""
+
+  def __init__(self, upload_id: str, filename: str, size: int, chunk_size: int,
+               owner: Optional[str]):
+    self.upload_id = upload_id
+    self.filename = filename
+    self.size = size
+    self.chunk_size = chunk_size
+    self.owner = owner
+
+  @property
+  def path(self) -> str:
+    return _upload_dir(self.upload_id)
+
+  @property
+  def spool_path(self) -> str:
+    return os.path.join(self.path, 'spool.pdf')
+
+  @property
+  def num_chunks(self) -> int:
+    return max(1, -(-self.size // self.chunk_size))
+
+  def chunk_length(self, index: int) -> int:
+    """Returns the expected length of chunk `index`."""
+    return min(self.chunk_size, self.size - index * self.chunk_size)
+
+  def has_chunk(self, index: int) -> bool:
+    return os.path.exists(os.path.join(self.path, 'chunks', str(index)))
+
+  def chunks_received(self) -> List[int]:
+    """Returns the indices of chunks received, in order."""
+    try:
+      names = os.listdir(os.path.join(self.path, 'chunks'))
+    except FileNotFoundError:
+      return []
+    return sorted(int(name) for name in names if name.isdigit())
+
+  def offset(self) -> int:
+    """Returns how many bytes have been received, counting from the start."""
+    for index in range(self.num_chunks):
+      if not self.has_chunk(index):
+        return index * self.chunk_size
+    return self.size
+
+  def is_complete(self) -> bool:
+    return self.offset() == self.size
+
+  def status(self):
+    return {
+        'upload_id': self.upload_id,
+        'size': self.size,
+        'chunk_size': self.chunk_size,
+        'offset': self.offset(),
+        'chunks_received': self.chunks_received(),
+        'progress': self.read_progress(),
+    }
+
+  def read_progress(self):
+    try:
+      with open(os.path.join(self.path, 'progress.json')) as progress:
+        return json.load(progress)
+    except (FileNotFoundError, ValueError):
+      return None
+
+  def write_progress(self, report):
+    """Publishes a progress report for pollers, replacing the last one."""
+    path = os.path.join(self.path, 'progress.json')
+    try:
+      with open(path + '.tmp', 'w') as progress:
+        json.dump(report, progress)
+      os.replace(path + '.tmp', path)
+    except FileNotFoundError:
+      pass  # The upload expired; nobody is polling for it.
+
+  def write_chunk(self, index: int, data: bytes, sha256: str):
+    """Verifies a chunk against its checksum and writes it to the spool."""
+    if not 0 <= index < self.num_chunks:
+      raise UploadError(f'Chunk {index} is out of range.')
+    if len(data) != self.chunk_length(index):
+      raise UploadError(f'Chunk {index} should be {self.chunk_length(index)} '
+                        f'bytes, got {len(data)}.')
+    if hashlib.sha256(data).hexdigest() != sha256.lower():
+      raise ChecksumError(f'Chunk {index} failed its checksum.')
+
+    fd = os.open(self.spool_path, os.O_WRONLY)
+    try:
+      os.pwrite(fd, data, index * self.chunk_size)
+    finally:
+      os.close(fd)
+
+    # Only mark the chunk received once its bytes are in place.
+    with open(os.path.join(self.path, 'chunks', str(index)), 'wb'):
+      pass
+
+  def open_completed(self) -> BinaryIO:
+    if not self.is_complete():
+      raise UploadError('Upload is not complete.')
+    return open(self.spool_path, 'rb')
+
+  def remove(self):
+    shutil.rmtree(self.path, ignore_errors=True)
+
+
+def create(filename: str, size: int, owner: Optional[str] = None) -> Upload:
+  """Starts a new resumable upload of `size` bytes."""
+  if size <= 0:
+    raise UploadError('Upload is empty.')
+  if size > document_ai_ocr.MAX_SIZE:
+    raise UploadError('PDF too large.')
+
+  upload = Upload(secrets.token_urlsafe(24), filename, size,
+                  FLAGS.upload_chunk_size, owner)
+  os.makedirs(os.path.join(upload.path, 'chunks'))
+  with open(upload.spool_path, 'wb') as spool:
+    spool.truncate(size)
+  with open(os.path.join(upload.path, 'upload.json'), 'w') as metadata:
+    json.dump(
+        {
+            'filename': upload.filename,
+            'size': upload.size,
+            'chunk_size': upload.chunk_size,
+            'owner': upload.owner,
+        }, metadata)
+
+  logging.info('Started upload of %d bytes in %d chunks.', size,
+               upload.num_chunks)
+  return upload
+
+
+def get(upload_id: str, owner: Optional[str] = None) -> Upload:
+  """Loads an upload, checking that it belongs to `owner`."""
+  try:
+    with open(os.path.join(_upload_dir(upload_id), 'upload.json')) as metadata:
+      data = json.load(metadata)
+  except FileNotFoundError as exc:
+    raise UnknownUploadError('Unknown upload.') from exc
+
+  if data['owner'] != owner:
+    raise UnknownUploadError('Unknown upload.')
+  return Upload(upload_id, data['filename'], data['size'], data['chunk_size'],
+                data['owner'])
+
+
+def remove_expired():
+  """Removes uploads with no activity in the last `--upload_expiry` seconds."""
+  try:
+    upload_ids = os.listdir(spool_dir())
+  except FileNotFoundError:
+    return
+
+  cutoff = time.time() - FLAGS.upload_expiry
+  for upload_id in upload_ids:
+    path = os.path.join(spool_dir(), upload_id)
+    try:
+      last_active = max(
+          os.stat(p).st_mtime
+          for p in (path, os.path.join(path, 'spool.pdf'))
+          if os.path.exists(p))
+    except (FileNotFoundError, ValueError):
+      continue  # Another worker removed it first.
+    if last_active < cutoff:
+      logging.info('Removing expired upload.')
+      shutil.rmtree(path, ignore_errors=True)
@@ -0,0 +1,104 @@
+# Copyright 2022 Google LLC. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import hashlib
+import os
+
+from absl.testing import absltest
+from absl.testing import flagsaver
+from pdf_sprinkles import uploads
+
+
+def sha256(data):
+  return hashlib.sha256(data).hexdigest()
+
+
+class UploadsTest(absltest.TestCase):
+
+  def setUp(self):
+    super().setUp()
+    self.enter_context(
+        flagsaver.flagsaver(upload_spool_dir=self.create_tempdir().full_path,
+                            upload_chunk_size=4))
+
+  def test_chunks_out_of_order(self):
+    upload = uploads.create('scan.pdf', 10)
+    self.assertEqual(upload.num_chunks, 3)
+
+    upload.write_chunk(2, b'89', sha256(b'89'))
+    self.assertEqual(upload.offset(), 0)
+    self.assertEqual(upload.status()['chunks_received'], [2])
+    upload.write_chunk(0, b'0123', sha256(b'0123'))
+    self.assertEqual(upload.offset(), 4)
+    self.assertEqual(upload.status()['chunks_received'], [0, 2])
+    self.assertFalse(upload.is_complete())
+    upload.write_chunk(1, b'4567', sha256(b'4567'))
+
+    upload = uploads.get(upload.upload_id)
+    self.assertTrue(upload.is_complete())
+    self.assertEqual(upload.filename, 'scan.pdf')
+    with upload.open_completed() as f:
+      self.assertEqual(f.read(), b'0123456789')
+
+  def test_progress(self):
+    upload = uploads.create('scan.pdf', 10)
+    self.assertIsNone(upload.status()['progress'])
+    upload.write_progress({'stage': 'recognizing'})
+    upload.write_progress({'stage': 'adding text', 'pages_done': 1})
+    self.assertEqual(upload.status()['progress'],
+                     {'stage': 'adding text', 'pages_done': 1})
+
+  def test_rejects_bad_chunks(self):
+    upload = uploads.create('scan.pdf', 10)
+    with self.assertRaisesRegex(uploads.ChecksumError, 'checksum'):
+      upload.write_chunk(0, b'0123', sha256(b'3210'))
+    with self.assertRaisesRegex(uploads.UploadError, 'bytes'):
+      upload.write_chunk(0, b'012', sha256(b'012'))
+    with self.assertRaisesRegex(uploads.UploadError, 'range'):
+      upload.write_chunk(3, b'', sha256(b''))
+    with self.assertRaisesRegex(uploads.UploadError, 'not complete'):
+      upload.open_completed()
+
+  def test_rejects_bad_sizes(self):
+    with self.assertRaisesRegex(uploads.UploadError, 'empty'):
+      uploads.create('scan.pdf', 0)
+    with self.assertRaisesRegex(uploads.UploadError, 'too large'):
+      uploads.create('scan.pdf', 21 * 1024 * 1024)
+
+  def test_checks_owner(self):
+    upload = uploads.create('scan.pdf', 10, owner='a@example.com')
+    self.assertEqual(
+        uploads.get(upload.upload_id, 'a@example.com').upload_id,
+        upload.upload_id)
+    with self.assertRaises(uploads.UnknownUploadError):
+      uploads.get(upload.upload_id, 'b@example.com')
+    with self.assertRaises(uploads.UnknownUploadError):
+      uploads.get('../../etc')
+    with self.assertRaises(uploads.UnknownUploadError):
+      uploads.get('x' * 32)
+
+  def test_remove_expired(self):
+    stale = uploads.create('stale.pdf', 10)
+    fresh = uploads.create('fresh.pdf', 10)
+    for path in (stale.path, stale.spool_path):
+      os.utime(path, (0, 0))
+
+    uploads.remove_expired()
+
+    self.assertFalse(os.path.exists(stale.path))
+    self.assertTrue(os.path.exists(fresh.path))
+
+
+if __name__ == '__main__':
+  absltest.main()
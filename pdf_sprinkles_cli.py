@@ -23,6 +23,7 @@ from typing import Sequence
 
 from absl import app
 from absl import flags
+from pdf_sprinkles import sidecar as sidecar_lib
 from pdf_sprinkles.convert import convert
 from tornado.platform.asyncio import AsyncIOMainLoop
 
@@ -30,19 +31,40 @@ from tornado.platform.asyncio import AsyncIOMainLoop
 FLAGS = flags.FLAGS
 flags.DEFINE_string('input', None, 'Path to input file')
 flags.DEFINE_string('output', None, 'Path to output file')
+flags.DEFINE_multi_enum(
+    'sidecar', [], sorted(sidecar_lib.FORMATS),
+    'Also write the text layer in this format, next to --output.')
+
+
+def sidecar_path(output: str, sidecar_format: str) -> str:
+  """Returns the path for a sidecar file, e.g. scan.pdf -> scan.hocr."""
+  root, ext = os.path.splitext(output)
+  if ext.lower() != '.pdf':
+    root = output
+  return root + sidecar_lib.FORMATS[sidecar_format][0]
 
 
 def main(argv: Sequence[str]) -> None:
   if len(argv) > 1:
     raise app.UsageError('Too many command-line arguments.')
 
+  if FLAGS.sidecar and not FLAGS.output:
+    raise app.UsageError('--sidecar requires --output.')
+
   AsyncIOMainLoop().install()
 
+  sidecar = sidecar_lib.Sidecar() if FLAGS.sidecar else None
   with open(FLAGS.input, 'rb') as input_file, open(
       FLAGS.output, 'wb') if FLAGS.output else open(
           sys.stdout.fileno(), 'wb', closefd=False) as output_file:
     asyncio.run(
-        convert(input_file, os.path.basename(FLAGS.input), output_file))
+        convert(input_file, os.path.basename(FLAGS.input), output_file,
+                sidecar=sidecar))
+
+  for sidecar_format in FLAGS.sidecar:
+    _, write_sidecar = sidecar_lib.FORMATS[sidecar_format]
+    with open(sidecar_path(FLAGS.output, sidecar_format), 'wb') as f:
+      write_sidecar(sidecar, f)
 
 
 if __name__ == '__main__':
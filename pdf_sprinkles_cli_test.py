@@ -0,0 +1,44 @@
+# Copyright 2022 Google LLC. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from absl import app
+from absl.testing import absltest
+from absl.testing import flagsaver
+import pdf_sprinkles_cli
+
+
+class SidecarPathTest(absltest.TestCase):
+
+  def test_replaces_pdf_extension(self):
+    self.assertEqual(pdf_sprinkles_cli.sidecar_path('out/scan.pdf', 'hocr'),
+                     'out/scan.hocr')
+    self.assertEqual(pdf_sprinkles_cli.sidecar_path('scan.PDF', 'alto'),
+                     'scan.alto.xml')
+    self.assertEqual(pdf_sprinkles_cli.sidecar_path('scan.pdf', 'json'),
+                     'scan.json')
+
+  def test_appends_to_other_names(self):
+    self.assertEqual(pdf_sprinkles_cli.sidecar_path('scan.out', 'json'),
+                     'scan.out.json')
+    self.assertEqual(pdf_sprinkles_cli.sidecar_path('scan', 'hocr'),
+                     'scan.hocr')
+
+  @flagsaver.flagsaver(input='scan.pdf', output=None, sidecar=['hocr'])
+  def test_sidecar_requires_output(self):
+    with self.assertRaisesRegex(app.UsageError, 'requires --output'):
+      pdf_sprinkles_cli.main(['pdf_sprinkles_cli'])
+
+
+if __name__ == '__main__':
+  absltest.main()
@@ -15,12 +15,16 @@
 # limitations under the License.
 """Web app that serves pdf_sprinkles."""
 
+import asyncio
 import base64
+import collections
+import contextlib
 import logging as py_logging
 import os.path
 import tempfile
 import traceback
 from typing import Sequence
+import zipfile
 
 from absl import app
 from absl import flags
@@ -33,7 +37,10 @@ from google.cloud.logging.handlers import AppEngineHandler
 from google.cloud.logging.handlers import setup_logging
 from pdf_sprinkles import app_context
 from pdf_sprinkles import document_ai_ocr
+from pdf_sprinkles import progress as progress_lib
+from pdf_sprinkles import sidecar as sidecar_lib
 from pdf_sprinkles import uimodules
+from pdf_sprinkles import uploads
 from pdf_sprinkles.convert import convert
 from third_party.hocr_tools import hocr_pdf
 import tornado.httpserver
@@ -50,6 +57,12 @@ flags.DEFINE_string('cookie_secret_id', None,
 flags.DEFINE_string('self_link', None,
                     'If set, displays a self link in the header.')
 flags.DEFINE_boolean('cloud_logging', False, 'Use cloud logging.')
+flags.DEFINE_integer('upload_sweep_interval', 60,
+                     'Seconds between sweeps for expired uploads.')
+
+# Outcomes of /recognize requests since this worker started, logged with each
+# cancellation or timeout so stopped work is visible apart from errors.
+conversion_outcomes = collections.Counter()
 
 
 class MainHandler(app_context.RequestHandler):
@@ -67,20 +80,171 @@ class WarmupHandler(app_context.RequestHandler):
     hocr_pdf.load_noto_sans()
 
 
+@contextlib.contextmanager
+def upload_errors_as_http_errors():
+  """Reports upload errors to the client with a matching HTTP status.
+
+  Unknown or expired uploads are 404 Not Found, so clients know to start
+  over, and chunks that fail their checksum are 422 Unprocessable Entity, so
+  clients know to send them again. Other upload errors are 400 Bad Request.
+  """
+  try:
+    yield
+  except uploads.UnknownUploadError as exc:
+    raise tornado.web.HTTPError(404, str(exc)) from exc
+  except uploads.ChecksumError as exc:
+    raise tornado.web.HTTPError(422, str(exc)) from exc
+  except uploads.UploadError as exc:
+    raise tornado.web.HTTPError(400, str(exc)) from exc
+
+
+def int_argument(handler: tornado.web.RequestHandler, name: str) -> int:
+  """Returns an integer argument, or reports 400 Bad Request."""
+  value = handler.get_argument(name)
+  try:
+    return int(value)
+  except ValueError as exc:
+    raise tornado.web.HTTPError(
+        400, f'Argument {name} must be an integer.') from exc
+
+
+class ApiHandler(app_context.RequestHandler):
+  """Handler that reports errors to the client as JSON."""
+
+  def write_error(self, status_code: int, **kwargs):
+    response = {}
+    if 'exc_info' in kwargs:
+      _, exc_value, _ = kwargs['exc_info']
+      if isinstance(exc_value, GoogleAPICallError):
+        response['message'] = exc_value.message
+      elif isinstance(exc_value, tornado.web.HTTPError):
+        response['message'] = exc_value.log_message or self._reason
+      else:
+        response['message'] = str(exc_value)
+      if self.settings.get('serve_traceback'):
+        response['traceback'] = traceback.format_exception(*kwargs['exc_info'])
+    else:
+      response['message'] = f'{status_code}: {self._reason}'
+
+    self.finish(response)
+
+
+class UploadsHandler(ApiHandler):
+  """Starts a resumable upload."""
+
+  def post(self):
+    filename = self.get_argument('filename')
+    size = int_argument(self, 'size')
+    with upload_errors_as_http_errors():
+      upload = uploads.create(filename, size, self.current_user)
+
+    self.set_status(201)
+    self.finish(upload.status())
+
+
+class UploadHandler(ApiHandler):
+  """Reports on a resumable upload, and receives its chunks."""
+
+  def get(self, upload_id):
+    with upload_errors_as_http_errors():
+      upload = uploads.get(upload_id, self.current_user)
+      self.finish(upload.status())
+
+  def put(self, upload_id):
+    index = int_argument(self, 'chunk')
+    sha256 = self.request.headers.get('X-Chunk-SHA256', '')
+    with upload_errors_as_http_errors():
+      upload = uploads.get(upload_id, self.current_user)
+      upload.write_chunk(index, self.request.body, sha256)
+      self.finish(upload.status())
+
+
 @tornado.web.stream_request_body
-class RecognizeHandler(app_context.RequestHandler):
-  """Recognize text in a PDF."""
+class RecognizeHandler(ApiHandler):
+  """Recognize text in a PDF.
+
+  The PDF is either the request body, or a completed upload named by the
+  `upload_id` argument. For uploads, progress can be polled from the upload
+  while it converts.
+
+  With one or more `sidecar` arguments (`hocr`, `alto` or `json`), responds
+  with a zip of the PDF and its text layer in those formats.
+  """
 
   def initialize(self):
     self.input_file = tempfile.TemporaryFile()
     self.output_file = tempfile.TemporaryFile()
+    self.convert_task = None
+    self.connection_closed = False
 
   def data_received(self, chunk):
     self.input_file.write(chunk)
 
+  def on_finish(self):
+    self.input_file.close()
+    self.output_file.close()
+
+  def on_connection_close(self):
+    self.connection_closed = True
+    # Stop converting once nobody is waiting for the result; this stops the
+    # Document AI call, pdf_info, and the export loop wherever they are.
+    if self.convert_task and not self.convert_task.done():
+      self.convert_task.cancel()
+    super().on_connection_close()
+
   async def post(self):
-    filename = self.get_argument('filename')
-    await convert(self.input_file, filename, self.output_file)
+    sidecar_formats = list(dict.fromkeys(self.get_arguments('sidecar')))
+    for sidecar_format in sidecar_formats:
+      if sidecar_format not in sidecar_lib.FORMATS:
+        raise tornado.web.HTTPError(
+            400, f'Unknown sidecar format: {sidecar_format}')
+    sidecar = sidecar_lib.Sidecar() if sidecar_formats else None
+
+    upload = None
+    upload_id = self.get_argument('upload_id', None)
+    if upload_id:
+      with upload_errors_as_http_errors():
+        upload = uploads.get(upload_id, self.current_user)
+        self.input_file.close()
+        self.input_file = upload.open_completed()
+      filename = upload.filename
+      progress = progress_lib.Progress(upload.write_progress)
+    else:
+      filename = self.get_argument('filename')
+      progress = progress_lib.Progress()
+
+    self.convert_task = asyncio.ensure_future(
+        convert(self.input_file, filename, self.output_file,
+                progress=progress, sidecar=sidecar))
+    try:
+      await self.convert_task
+    except asyncio.CancelledError:
+      # Only a disconnect is ours to absorb; let other cancellations through.
+      if not (self.connection_closed and self.convert_task.cancelled()):
+        raise
+      conversion_outcomes['cancelled'] += 1
+      logging.warning(
+          'Conversion cancelled: client disconnected (%d cancelled, '
+          '%d timed out, %d completed on this worker).',
+          conversion_outcomes['cancelled'], conversion_outcomes['timed_out'],
+          conversion_outcomes['completed'])
+      return
+    except asyncio.TimeoutError as exc:
+      conversion_outcomes['timed_out'] += 1
+      logging.warning(
+          'Conversion timed out: exceeded --request_timeout (%d cancelled, '
+          '%d timed out, %d completed on this worker).',
+          conversion_outcomes['cancelled'], conversion_outcomes['timed_out'],
+          conversion_outcomes['completed'])
+      raise tornado.web.HTTPError(504, str(exc) or
+                                  'Conversion took too long.') from exc
+    conversion_outcomes['completed'] += 1
+
+    content_type = 'application/pdf'
+    if sidecar:
+      self.zip_output(filename, sidecar, sidecar_formats)
+      filename = os.path.splitext(filename)[0] + '.zip'
+      content_type = 'application/zip'
 
     self.output_file.seek(0, os.SEEK_END)
     output_size = self.output_file.tell()
@@ -93,31 +257,45 @@ class RecognizeHandler(app_context.RequestHandler):
     encoded_filename = tornado.escape.url_escape(filename, plus=False)
     self.set_header('Content-Disposition',
                     f"attachment; filename*=utf-8''{encoded_filename}")
-    self.set_header('Content-Type', 'application/pdf')
+    self.set_header('Content-Type', content_type)
     self.set_header('Cache-Control', 'private')
 
+    progress.update('sending')
     while True:
       data = self.output_file.read(65536)
       if not data:
         break
       self.write(data)
       await self.flush()
+      progress.update(bytes_sent=progress.bytes_sent + len(data))
 
+    # We forget uploaded PDFs once they're sent.
+    if upload:
+      upload.remove()
     self.finish()
 
-  def write_error(self, status_code: int, **kwargs):
-    response = {}
-    if 'exc_info' in kwargs:
-      _, exc_value, _ = kwargs['exc_info']
-      response['message'] = (
-          exc_value.message
-          if isinstance(exc_value, GoogleAPICallError) else str(exc_value))
-      if self.settings.get('serve_traceback'):
-        response['traceback'] = traceback.format_exception(*kwargs['exc_info'])
-    else:
-      response['message'] = f'{status_code}: {self._reason}'
-
-    self.finish(response)
+  def zip_output(self, filename, sidecar, sidecar_formats):
+    """Replaces output_file with a zip of it and the requested sidecars."""
+    root = os.path.splitext(filename)[0]
+    zip_file = tempfile.TemporaryFile()
+    with zipfile.ZipFile(zip_file, 'w') as archive:
+      self.output_file.seek(0)
+      # PDF streams are already compressed.
+      with archive.open(zipfile.ZipInfo(root + '.pdf'), 'w') as entry:
+        while True:
+          data = self.output_file.read(65536)
+          if not data:
+            break
+          entry.write(data)
+      for sidecar_format in sidecar_formats:
+        ext, write_sidecar = sidecar_lib.FORMATS[sidecar_format]
+        info = zipfile.ZipInfo(root + ext)
+        info.compress_type = zipfile.ZIP_DEFLATED
+        with archive.open(info, 'w') as entry:
+          write_sidecar(sidecar, entry)
+
+    self.output_file.close()
+    self.output_file = zip_file
 
 
 class StaticFileHandler(tornado.web.StaticFileHandler,
@@ -179,6 +357,8 @@ def main(argv: Sequence[str]) -> None:
           (r'/', MainHandler, None, 'main'),
           (r'/_ah/warmup', WarmupHandler),
           (r'/recognize', RecognizeHandler, None, 'recognize'),
+          (r'/uploads', UploadsHandler, None, 'uploads'),
+          (r'/uploads/([\w-]+)', UploadHandler),
       ],
       static_handler_class=StaticFileHandler,
       static_path=os.path.join(os.path.dirname(__file__), 'static'),
@@ -198,6 +378,9 @@ def main(argv: Sequence[str]) -> None:
   server.bind(FLAGS.port, FLAGS.address, reuse_port=True)
   server.start()
 
+  tornado.ioloop.PeriodicCallback(uploads.remove_expired,
+                                  FLAGS.upload_sweep_interval * 1000).start()
+
   logging.info('Started server on %s:%d', FLAGS.address, FLAGS.port)
   tornado.ioloop.IOLoop.current().start()
 
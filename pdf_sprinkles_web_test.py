@@ -0,0 +1,219 @@
+# Copyright 2022 Google LLC. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import asyncio
+import hashlib
+import io
+import json
+import socket
+import tempfile
+from unittest import mock
+import zipfile
+
+from absl.testing import absltest
+from absl.testing import flagsaver
+import pdf_sprinkles_web
+import tornado.iostream
+import tornado.testing
+import tornado.web
+
+
+class RecognizeHandlerTest(tornado.testing.AsyncHTTPTestCase):
+
+  def setUp(self):
+    super().setUp()
+    self.started = asyncio.Event()
+    self.cancelled = asyncio.Event()
+
+    async def slow_convert(*args, **kwargs):
+      del args, kwargs  # Unused.
+      self.started.set()
+      try:
+        await asyncio.sleep(60)
+      except asyncio.CancelledError:
+        self.cancelled.set()
+        raise
+
+    patcher = mock.patch.object(pdf_sprinkles_web, 'convert', slow_convert)
+    patcher.start()
+    self.addCleanup(patcher.stop)
+
+  def get_app(self):
+    return tornado.web.Application([
+        (r'/recognize', pdf_sprinkles_web.RecognizeHandler),
+    ])
+
+  @tornado.testing.gen_test
+  async def test_disconnect_cancels_convert(self):
+    cancelled_before = pdf_sprinkles_web.conversion_outcomes['cancelled']
+
+    stream = tornado.iostream.IOStream(socket.socket())
+    await stream.connect(('127.0.0.1', self.get_http_port()))
+    await stream.write(b'POST /recognize?filename=scan.pdf HTTP/1.1\r\n'
+                       b'Host: localhost\r\nContent-Length: 4\r\n\r\n%PDF')
+    await asyncio.wait_for(self.started.wait(), timeout=5)
+    stream.close()
+
+    await asyncio.wait_for(self.cancelled.wait(), timeout=5)
+    while (pdf_sprinkles_web.conversion_outcomes['cancelled'] ==
+           cancelled_before):
+      await asyncio.sleep(0.01)
+    self.assertEqual(pdf_sprinkles_web.conversion_outcomes['cancelled'],
+                     cancelled_before + 1)
+
+
+class RecognizeTimeoutTest(tornado.testing.AsyncHTTPTestCase):
+
+  def setUp(self):
+    super().setUp()
+
+    async def timed_out_convert(*args, **kwargs):
+      del args, kwargs  # Unused.
+      raise asyncio.TimeoutError('Conversion took too long.')
+
+    patcher = mock.patch.object(pdf_sprinkles_web, 'convert',
+                                timed_out_convert)
+    patcher.start()
+    self.addCleanup(patcher.stop)
+
+  def get_app(self):
+    return tornado.web.Application([
+        (r'/recognize', pdf_sprinkles_web.RecognizeHandler),
+    ])
+
+  def test_timeout_is_gateway_timeout(self):
+    timed_out_before = pdf_sprinkles_web.conversion_outcomes['timed_out']
+
+    response = self.fetch('/recognize?filename=scan.pdf', method='POST',
+                          body=b'%PDF')
+
+    self.assertEqual(response.code, 504)
+    self.assertEqual(json.loads(response.body)['message'],
+                     'Conversion took too long.')
+    self.assertEqual(pdf_sprinkles_web.conversion_outcomes['timed_out'],
+                     timed_out_before + 1)
+
+
+class RecognizeSidecarTest(tornado.testing.AsyncHTTPTestCase):
+
+  def setUp(self):
+    super().setUp()
+
+    async def fake_convert(input_file, input_file_name, output_file, **kwargs):
+      del input_file, input_file_name  # Unused.
+      output_file.write(b'%PDF-1.4 searchable')
+      sidecar = kwargs['sidecar']
+      sidecar.add_page(612, 792)
+      sidecar.add_line([72, 700, 120, 712], 0.98)
+      sidecar.add_word('Hello', [72, 700, 120, 712], 0.99)
+
+    patcher = mock.patch.object(pdf_sprinkles_web, 'convert', fake_convert)
+    patcher.start()
+    self.addCleanup(patcher.stop)
+
+  def get_app(self):
+    return tornado.web.Application([
+        (r'/recognize', pdf_sprinkles_web.RecognizeHandler),
+    ])
+
+  def test_zips_pdf_with_sidecars(self):
+    response = self.fetch(
+        '/recognize?filename=scan.pdf&sidecar=hocr&sidecar=json&sidecar=hocr',
+        method='POST', body=b'%PDF')
+    self.assertEqual(response.code, 200)
+    self.assertEqual(response.headers['Content-Type'], 'application/zip')
+    self.assertIn("filename*=utf-8''scan.zip",
+                  response.headers['Content-Disposition'])
+
+    with zipfile.ZipFile(io.BytesIO(response.body)) as archive:
+      self.assertEqual(archive.namelist(),
+                       ['scan.pdf', 'scan.hocr', 'scan.json'])
+      self.assertEqual(archive.read('scan.pdf'), b'%PDF-1.4 searchable')
+      words = json.loads(archive.read('scan.json'))['pages'][0]['lines'][0][
+          'words']
+      self.assertEqual([w['text'] for w in words], ['Hello'])
+
+  def test_rejects_unknown_sidecar(self):
+    response = self.fetch('/recognize?filename=scan.pdf&sidecar=docx',
+                          method='POST', body=b'%PDF')
+    self.assertEqual(response.code, 400)
+    self.assertIn('Unknown sidecar format',
+                  json.loads(response.body)['message'])
+
+
+class UploadHandlerTest(tornado.testing.AsyncHTTPTestCase):
+
+  def get_app(self):
+    return tornado.web.Application([
+        (r'/uploads', pdf_sprinkles_web.UploadsHandler),
+        (r'/uploads/([\w-]+)', pdf_sprinkles_web.UploadHandler),
+    ])
+
+  def assertBadRequest(self, response, message):
+    self.assertEqual(response.code, 400)
+    self.assertIn(message, json.loads(response.body)['message'])
+
+  def test_rejects_bad_arguments(self):
+    with tempfile.TemporaryDirectory() as spool_dir, flagsaver.flagsaver(
+        upload_spool_dir=spool_dir):
+      self.check_bad_arguments()
+
+  def check_bad_arguments(self):
+    self.assertBadRequest(
+        self.fetch('/uploads?filename=scan.pdf&size=abc', method='POST',
+                   body=b''), 'size must be an integer')
+    self.assertBadRequest(
+        self.fetch(f'/uploads?filename=scan.pdf&size={21 * 1024 * 1024}',
+                   method='POST', body=b''), 'too large')
+
+    response = self.fetch('/uploads?filename=scan.pdf&size=4', method='POST',
+                          body=b'')
+    self.assertEqual(response.code, 201)
+    upload_id = json.loads(response.body)['upload_id']
+    self.assertBadRequest(
+        self.fetch(f'/uploads/{upload_id}?chunk=zz', method='PUT', body=b'x'),
+        'chunk must be an integer')
+    self.assertBadRequest(
+        self.fetch(f'/uploads/{upload_id}?chunk=0', method='PUT', body=b'x'),
+        'should be 4 bytes')
+
+  def test_reports_retryable_errors(self):
+    with tempfile.TemporaryDirectory() as spool_dir, flagsaver.flagsaver(
+        upload_spool_dir=spool_dir, upload_chunk_size=2):
+      self.check_retryable_errors()
+
+  def check_retryable_errors(self):
+    response = self.fetch('/uploads/' + 'x' * 32)
+    self.assertEqual(response.code, 404)
+
+    response = self.fetch('/uploads?filename=scan.pdf&size=4', method='POST',
+                          body=b'')
+    upload_id = json.loads(response.body)['upload_id']
+    response = self.fetch(
+        f'/uploads/{upload_id}?chunk=1', method='PUT', body=b'DF',
+        headers={'X-Chunk-SHA256': hashlib.sha256(b'PD').hexdigest()})
+    self.assertEqual(response.code, 422)
+    self.assertIn('checksum', json.loads(response.body)['message'])
+
+    response = self.fetch(
+        f'/uploads/{upload_id}?chunk=1', method='PUT', body=b'DF',
+        headers={'X-Chunk-SHA256': hashlib.sha256(b'DF').hexdigest()})
+    self.assertEqual(response.code, 200)
+    status = json.loads(self.fetch(f'/uploads/{upload_id}').body)
+    self.assertEqual(status['offset'], 0)
+    self.assertEqual(status['chunks_received'], [1])
+
+
+if __name__ == '__main__':
+  absltest.main()
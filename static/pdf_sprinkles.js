@@ -75,6 +75,196 @@ class AlertBox {
   }
 }
 
+/** Number of chunks to upload at once. */
+const UPLOAD_PARALLELISM = 3;
+
+/** Number of times to retry a chunk before giving up on the upload. */
+const UPLOAD_RETRIES = 5;
+
+/** Milliseconds between polls for conversion progress. */
+const PROGRESS_POLL_INTERVAL = 1000;
+
+function sleep(ms) {
+  return new Promise(resolve => setTimeout(resolve, ms));
+}
+
+function formatMegabytes(bytes) {
+  return `${(bytes / (1024 * 1024)).toFixed(1)} MB`;
+}
+
+/** Describes a server progress report for the user. */
+function describeProgress(progress) {
+  switch (progress.stage) {
+    case 'recognizing':
+      return 'Recognizing text in your ' +
+          `${formatMegabytes(progress.input_bytes)} PDF with Document AI`;
+    case 'reading PDF':
+      return 'Reading page sizes from your PDF';
+    case 'adding text':
+      return `Adding text to page ${progress.pages_done} of ` +
+          `${progress.pages_total}`;
+    case 'adding images':
+      return `Adding images to page ${progress.pages_done} of ` +
+          `${progress.pages_total}`;
+    case 'sending':
+      return `Sending searchable PDF (${formatMegabytes(progress.bytes_sent)})`;
+    default:
+      return 'Waiting for the server';
+  }
+}
+
+async function sha256Hex(blob) {
+  const digest = await crypto.subtle.digest('SHA-256', await blob.arrayBuffer());
+  return Array.from(new Uint8Array(digest))
+      .map(b => b.toString(16).padStart(2, '0'))
+      .join('');
+}
+
+/**
+ * Uploads a file in checksummed chunks, resuming an earlier upload of the
+ * same file in this session when the server still has it.
+ */
+class ResumableUpload {
+  #uploadsUrl;
+  #file;
+  #storageKey;
+  #onProgress;
+
+  /**
+   * @param {string} uploadsUrl
+   * @param {!File} file
+   * @param {function(number, number)} onProgress called with bytes uploaded
+   *     and total bytes as chunks finish.
+   */
+  constructor(uploadsUrl, file, onProgress) {
+    this.#uploadsUrl = uploadsUrl;
+    this.#file = file;
+    this.#onProgress = onProgress;
+    this.#storageKey =
+        `upload:${file.name}:${file.size}:${file.lastModified}`;
+  }
+
+  /** Uploads the file, returning its upload ID once the server has it all. */
+  async upload() {
+    let status = await this.#resumeOrCreate();
+    const numChunks = Math.ceil(status.size / status.chunk_size);
+    const chunkLength = index =>
+        Math.min(status.chunk_size, status.size - index * status.chunk_size);
+
+    // Skip chunks the server already has, even past a gap left by chunks
+    // that were in flight in parallel when the last attempt stopped.
+    const received = new Set(status.chunks_received);
+    const pending = [];
+    let bytesUploaded = 0;
+    for (let index = 0; index < numChunks; index++) {
+      if (received.has(index)) {
+        bytesUploaded += chunkLength(index);
+      } else {
+        pending.push(index);
+      }
+    }
+    this.#onProgress(bytesUploaded, status.size);
+
+    const worker = async () => {
+      while (pending.length) {
+        const index = pending.shift();
+        await this.#uploadChunk(status, index);
+        bytesUploaded += chunkLength(index);
+        this.#onProgress(bytesUploaded, status.size);
+      }
+    };
+    const workers = [];
+    for (let i = 0; i < Math.min(UPLOAD_PARALLELISM, pending.length); i++) {
+      workers.push(worker());
+    }
+    await Promise.all(workers);
+
+    // Chunks may finish out of order; ask the server where it ended up.
+    status = await this.status(status.upload_id);
+    if (status.offset !== status.size) {
+      throw new Error('Upload did not complete. Please try again.');
+    }
+    return status.upload_id;
+  }
+
+  /** Fetches the server's status for an upload, including its progress. */
+  status(uploadId) {
+    return this.#fetchJson(`${this.#uploadsUrl}/${uploadId}`);
+  }
+
+  /** Forgets this upload, once the server has consumed it. */
+  forget() {
+    sessionStorage.removeItem(this.#storageKey);
+  }
+
+  async #resumeOrCreate() {
+    const uploadId = sessionStorage.getItem(this.#storageKey);
+    if (uploadId) {
+      try {
+        return await this.status(uploadId);
+      } catch (errorOrResponse) {
+        // Only 404 means the upload expired or the server forgot it; then we
+        // start a new one.
+        if (!(errorOrResponse instanceof Response &&
+              errorOrResponse.status === 404)) {
+          throw errorOrResponse;
+        }
+        this.forget();
+      }
+    }
+
+    const params = new URLSearchParams(
+        {filename: this.#file.name, size: this.#file.size});
+    const status = await this.#fetchJson(`${this.#uploadsUrl}?${params}`, {
+      method: 'POST',
+      headers: {'X-XSRFToken': getCookie('_xsrf')},
+    });
+    sessionStorage.setItem(this.#storageKey, status.upload_id);
+    return status;
+  }
+
+  async #uploadChunk(status, index) {
+    const start = index * status.chunk_size;
+    const chunk = this.#file.slice(start, start + status.chunk_size);
+    const checksum = await sha256Hex(chunk);
+    const url = `${this.#uploadsUrl}/${status.upload_id}?chunk=${index}`;
+
+    for (let attempt = 0; ; attempt++) {
+      try {
+        return await this.#fetchJson(url, {
+          method: 'PUT',
+          headers: {
+            'X-XSRFToken': getCookie('_xsrf'),
+            'X-Chunk-SHA256': checksum,
+          },
+          body: chunk,
+        });
+      } catch (errorOrResponse) {
+        // Retry network errors, server errors, and chunks corrupted in
+        // transit (422); the client sent something wrong on other errors, and
+        // sending it again won't help.
+        const retryable = errorOrResponse instanceof TypeError ||
+            (errorOrResponse instanceof Response &&
+             (errorOrResponse.status >= 500 ||
+              errorOrResponse.status === 422));
+        if (!retryable || attempt >= UPLOAD_RETRIES) {
+          throw errorOrResponse;
+        }
+      }
+      // Exponential backoff with full jitter.
+      await sleep(Math.random() * 500 * 2 ** attempt);
+    }
+  }
+
+  async #fetchJson(url, options) {
+    const response = await fetch(url, options);
+    if (!response.ok) {
+      throw response;
+    }
+    return response.json();
+  }
+}
+
 class PdfSprinkles {
   constructor(formEl, alertBox) {
     this.formEl = formEl;
@@ -86,30 +276,43 @@ class PdfSprinkles {
   submitForm(event) {
     event.preventDefault();
     const pdf = document.getElementById('pdf').files[0];
-    this.alertBox.showWorking('Uploading file to Document AI');
-    fetch(`${this.formEl.action}?filename=${encodeURIComponent(pdf.name)}`, {
-      method: 'POST',
-      headers: {
-        'X-XSRFToken': getCookie('_xsrf'),
-      },
-      body: pdf,
+    const upload = new ResumableUpload(
+        this.formEl.dataset.uploads, pdf, (bytesUploaded, size) => {
+          this.alertBox.showWorking(
+              `Uploading file (${formatMegabytes(bytesUploaded)} of ` +
+              `${formatMegabytes(size)})`);
+        });
+    let stopPolling = () => {};
+    upload.upload().then(uploadId => {
+      this.alertBox.showWorking('Uploading file to Document AI');
+      stopPolling = this.#pollProgress(upload, uploadId);
+      return fetch(
+          `${this.formEl.action}?upload_id=${encodeURIComponent(uploadId)}`, {
+            method: 'POST',
+            headers: {
+              'X-XSRFToken': getCookie('_xsrf'),
+            },
+          });
     }).then(response => {
       if (!response.ok) {
         throw response;
       }
       return response.blob();
     }).then(blob => {
+      stopPolling();
+      upload.forget();
       const link = document.createElement('a');
       link.href = window.URL.createObjectURL(blob);
       link.download = pdf.name;
       link.click();
       this.alertBox.showSuccess('Your download will begin shortly');
     }).catch(errorOrResponse => {
-      if (errorOrResponse instanceof TypeError) {
+      stopPolling();
+      if (errorOrResponse instanceof Response) {
+        return errorOrResponse.text();
+      } else {
         this.alertBox.showError(errorOrResponse.message);
         console.error(errorOrResponse);
-      } else {
-        return errorOrResponse.text();
       }
     }).then(maybeErrorText => {
       if (!maybeErrorText) {
@@ -125,6 +328,29 @@ class PdfSprinkles {
       }
     });
   }
+
+  /**
+   * Shows conversion progress until the returned function is called. Polls
+   * are sequential, so a slow server never has more than one outstanding.
+   */
+  #pollProgress(upload, uploadId) {
+    let polling = true;
+    const poll = async () => {
+      while (polling) {
+        await sleep(PROGRESS_POLL_INTERVAL);
+        try {
+          const status = await upload.status(uploadId);
+          if (polling && status.progress) {
+            this.alertBox.showWorking(describeProgress(status.progress));
+          }
+        } catch {
+          // Progress is best effort; the conversion request reports errors.
+        }
+      }
+    };
+    poll();
+    return () => { polling = false; };
+  }
 }
 
 const pdfSprinkles = new PdfSprinkles(
@@ -41,8 +41,15 @@ flags.DEFINE_float('min_confidence', 0.9, 'Minimum confidence of lines to '
                    'include in output.')
 
 
-async def export_pdf(document, mediaboxes, title, output_file):
-  """Create a searchable PDF from an input file and a Document."""
+async def export_pdf(document, mediaboxes, title, output_file, deadline=None,
+                     progress=None, sidecar=None):
+  """Create a searchable PDF from an input file and a Document.
+
+  Yields to the event loop between pages, so cancelling the calling task stops
+  the export there. If `deadline` (in event loop time) passes, raises
+  asyncio.TimeoutError at the next page. If set, `progress` is updated after
+  each page, and `sidecar` collects the text layer as it's drawn.
+  """
   logging.info('Exporting recognized PDF with %d pages.', len(mediaboxes))
 
   load_noto_sans()
@@ -51,17 +58,25 @@ async def export_pdf(document, mediaboxes, title, output_file):
   pdf = Canvas(text_buf, pageCompression=1)
   pdf.setTitle(title)
 
-  for mediabox, page in zip(mediaboxes, document.pages):
-    await asyncio.sleep(0)
+  pages_total = min(len(mediaboxes), len(document.pages))
+  for pages_done, (mediabox, page) in enumerate(
+      zip(mediaboxes, document.pages), 1):
+    await next_page(deadline)
     pdf.setPageSize(mediabox)
-    add_text_layer(pdf, document, page, *mediabox)
+    if sidecar:
+      sidecar.add_page(*mediabox)
+    add_text_layer(pdf, document, page, *mediabox, sidecar=sidecar)
     pdf.showPage()
+    if progress:
+      progress.update('adding text', pages_done=pages_done,
+                      pages_total=pages_total)
 
   pdf.save()
 
   with Pdf.open(text_buf) as text_pdf:
-    for text_page, page in zip(text_pdf.pages, document.pages):
-      await asyncio.sleep(0)
+    for pages_done, (text_page, page) in enumerate(
+        zip(text_pdf.pages, document.pages), 1):
+      await next_page(deadline)
       _, _, width, height = text_page.trimbox
       width = float(width)
       height = float(height)
@@ -72,15 +87,28 @@ async def export_pdf(document, mediaboxes, title, output_file):
                       outputstream=bg_buf)
       with Pdf.open(bg_buf) as bg_pdf:
         text_page.add_underlay(bg_pdf.pages[0])
+      if progress:
+        progress.update('adding images', pages_done=pages_done,
+                        pages_total=pages_total)
 
     text_pdf.save(output_file)
 
 
-def add_text_layer(pdf, document, page, width, height):
+async def next_page(deadline):
+  """Yields between pages, giving cancellations and deadlines a chance."""
+  await asyncio.sleep(0)
+  if deadline is not None and asyncio.get_running_loop().time() > deadline:
+    raise asyncio.TimeoutError('Conversion took too long.')
+
+
+def add_text_layer(pdf, document, page, width, height, sidecar=None):
   """Draws an invisible text layer for OCR data."""
   for line in page.lines:
     if line.layout.confidence < FLAGS.min_confidence:
       continue
+    if sidecar:
+      sidecar.add_line(pdf_bbox(line.layout, width, height),
+                       line.layout.confidence)
 
     left, top, _, bottom = bbox(line.layout)
     left *= width
@@ -103,6 +131,9 @@ def add_text_layer(pdf, document, page, width, height):
       rawtext = get_text(token.layout, document)
       if not rawtext:
         continue
+      if sidecar and rawtext.strip():
+        sidecar.add_word(rawtext.strip(), pdf_bbox(token.layout, width, height),
+                         token.layout.confidence)
       font_width = pdf.stringWidth(rawtext, 'Noto Sans', 8)
       if font_width <= 0:
         continue
@@ -130,6 +161,13 @@ def bbox(layout):
   return [left, top, right, bottom]
 
 
+def pdf_bbox(layout, width, height):
+  """Returns [left, bottom, right, top] in PDF units, origin at bottom left."""
+  left, top, right, bottom = bbox(layout)
+  return [left * width, (1 - top) * height, right * width,
+          (1 - bottom) * height]
+
+
 def start_index(layout):
   return layout.text_anchor.text_segments[0].start_index
 